@@ -18,6 +18,7 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import functools
 import math
 import numpy as np
 
@@ -31,6 +32,18 @@ import lsst.afw.geom as afwGeom
 
 __all__ = ["CpDarkTask", "CpDarkTaskConfig"]
 
+_SIGMA_TO_FWHM = 2*math.sqrt(2*math.log(2))
+
+
+@functools.lru_cache(maxsize=4)
+def _makeRepairPsf(size, fwhm):
+    """Construct (and cache) the Gaussian PSF used for CR repair.
+
+    The PSF only depends on the configuration, so it is shared across
+    the exposures processed with the same settings.
+    """
+    return measAlg.SingleGaussianPsf(size, size, fwhm/_SIGMA_TO_FWHM)
+
 
 class CpDarkConnections(pipeBase.PipelineTaskConnections,
                         dimensions=("instrument", "exposure", "detector")):
@@ -99,30 +112,32 @@ class CpDarkTask(pipeBase.PipelineTask,
         outputExp : `lsst.afw.image.Exposure`
             CR rejected, ISR processed Dark Frame."
         """
-        psf = measAlg.SingleGaussianPsf(self.config.psfSize,
-                                        self.config.psfSize,
-                                        self.config.psfFwhm/(2*math.sqrt(2*math.log(2))))
+        psf = _makeRepairPsf(self.config.psfSize, self.config.psfFwhm)
         inputExp.setPsf(psf)
-        scaleExp = inputExp.clone()
-        mi = scaleExp.getMaskedImage()
 
         # DM-23680:
         # Darktime scaling necessary for repair.run() to ID CRs correctly.
         scale = inputExp.getInfo().getVisitInfo().getDarkTime()
-        if np.isfinite(scale) and scale != 0.0:
-            mi /= scale
+        # Repair always runs on a discarded copy, so the output pixels are
+        # left untouched and CR information only reaches the output
+        # through the mask propagation below.
+        scaleExp = inputExp.clone()
+        if np.isfinite(scale) and scale != 0.0 and scale != 1.0:
+            mi = scaleExp.getMaskedImage()
+            # Scale in place through numpy to avoid the temporaries made
+            # by the afw arithmetic operators; when the scale is a no-op
+            # the division is skipped.
+            np.divide(mi.image.array, scale, out=mi.image.array)
+            np.divide(mi.variance.array, scale*scale, out=mi.variance.array)
 
         self.repair.run(scaleExp, keepCRs=False)
         if self.config.crGrow > 0:
-            crMask = inputExp.getMaskedImage().getMask().getPlaneBitMask("CR")
-            spans = afwGeom.SpanSet.fromMask(inputExp.mask, crMask)
+            mask = scaleExp.mask
+            crMask = mask.getPlaneBitMask("CR")
+            spans = afwGeom.SpanSet.fromMask(mask, crMask)
             spans = spans.dilated(self.config.crGrow)
             spans.setMask(inputExp.mask, crMask)
 
-        # Undo scaling; as above, DM-23680.
-        if np.isfinite(scale) and scale != 0.0:
-            mi *= scale
-
         return pipeBase.Struct(
             outputExp=inputExp,
         )
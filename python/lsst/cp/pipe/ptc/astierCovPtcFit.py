@@ -124,12 +124,12 @@ def makeCovArray(inputTuple, maxRangeFromTuple=8):
     else:
         cutTuple = inputTuple
     # increasing mu order, so that we can group measurements with the same mu
-    muTemp = cutTuple['mu']
-    ind = np.argsort(muTemp)
+    order = np.argsort(cutTuple['mu'])
 
-    cutTuple = cutTuple[ind]
+    # Gather only the numeric columns the fit needs; reordering the full
+    # records would also shuffle the wide string fields along.
     # should group measurements on the same image pairs(same average)
-    mu = cutTuple['mu']
+    mu = np.ascontiguousarray(cutTuple['mu'][order])
     xx = np.hstack(([mu[0]], mu))
     delta = xx[1:] - xx[:-1]
     steps, = np.where(delta > 0)
@@ -137,12 +137,14 @@ def makeCovArray(inputTuple, maxRangeFromTuple=8):
     ind[steps] = 1
     ind = np.cumsum(ind)  # this acts as an image pair index.
     # now fill the 3-d cov array(and variance)
-    muVals = np.array(np.unique(mu))
-    i = cutTuple['i'].astype(int)
-    j = cutTuple['j'].astype(int)
-    c = 0.5*cutTuple['cov']
-    n = cutTuple['npix']
-    v = 0.5*cutTuple['var']
+    # mu is already sorted, so the group starts give the unique values
+    # without a second sort.
+    muVals = mu[np.hstack(([0], steps))]
+    i = cutTuple['i'][order].astype(int)
+    j = cutTuple['j'][order].astype(int)
+    c = 0.5*cutTuple['cov'][order]
+    n = np.ascontiguousarray(cutTuple['npix'][order])
+    v = 0.5*cutTuple['var'][order]
     # book and fill
     cov = np.ndarray((len(muVals), np.max(i)+1, np.max(j)+1))
     var = np.zeros_like(cov)
@@ -524,11 +526,13 @@ class CovFit:
         """To be used in weightedRes"""
         if params is not None:
             self.setParamValues(params)
-        covModel = np.nan_to_num(self.evalCovModel())
-        weightedRes = (covModel-self.cov)*self.sqrtW
-        maskedWeightedRes = weightedRes
+        # Sanitize in place and fold the subtraction and weighting into the
+        # same buffer; this runs once per leastsq evaluation.
+        weightedRes = np.nan_to_num(self.evalCovModel(), copy=False)
+        weightedRes -= self.cov
+        weightedRes *= self.sqrtW
 
-        return maskedWeightedRes
+        return weightedRes
 
     def weightedRes(self, params=None):
         """Weighted residuals.
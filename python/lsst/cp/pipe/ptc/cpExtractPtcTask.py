@@ -19,7 +19,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
 import numpy as np
+import scipy.fft as sfft
 
 import lsst.afw.math as afwMath
 import lsst.pex.config as pexConfig
@@ -28,7 +32,7 @@ from lsst.cp.pipe.utils import arrangeFlatsByExpTime
 
 import lsst.pipe.base.connectionTypes as cT
 
-from .astierCovPtcUtils import (fftSize, CovFft, computeCovDirect)
+from .astierCovPtcUtils import (CovFft, computeCovDirect)
 from .astierCovPtcFit import makeCovArray
 
 from lsst.ip.isr import PhotonTransferCurveDataset
@@ -37,6 +41,58 @@ from lsst.ip.isr import PhotonTransferCurveDataset
 __all__ = ['PhotonTransferCurveExtractConfig', 'PhotonTransferCurveExtractTask']
 
 
+@functools.lru_cache(maxsize=8)
+def _fftShapeFor(nRows, nCols, maxRangeCov):
+    """Padded FFT shape for a difference image, cached per amp geometry.
+
+    Pad to fast real-FFT lengths rather than the next power of two; this
+    typically over-pads far less for CCD-sized images. The last
+    dimension is rounded up to even so the rfft2/irfft2 round trip is
+    exact without an extra internal copy.
+    """
+    fastCols = sfft.next_fast_len(nCols + maxRangeCov + 2, real=True)
+    return (sfft.next_fast_len(nRows + maxRangeCov + 2, real=True),
+            fastCols + (fastCols & 1))
+
+
+def _sigmaClippedMeanVar(values, nSigma, nIter):
+    """Clipped mean and sample variance of the finite values of an array.
+
+    Iteratively discards values more than ``nSigma`` standard deviations
+    from the mean, the same statistic as afwMath MEANCLIP/VARIANCECLIP
+    but computed directly on a plain array.
+
+    Parameters
+    ----------
+    values : `numpy.ndarray`
+        Input values; non-finite entries are ignored.
+    nSigma : `float`
+        Clipping threshold, in standard deviations.
+    nIter : `int`
+        Maximum number of clipping iterations.
+
+    Returns
+    -------
+    mean : `float`
+        Clipped mean, or NaN if fewer than two values survive.
+    variance : `float`
+        Clipped sample variance, or NaN if fewer than two values survive.
+    """
+    values = values[np.isfinite(values)]
+    for _ in range(nIter):
+        if len(values) < 2:
+            break
+        mean = values.mean()
+        bound = nSigma*values.std()
+        clipped = values[np.abs(values - mean) <= bound]
+        if len(clipped) == len(values):
+            break
+        values = clipped
+    if len(values) < 2:
+        return np.nan, np.nan
+    return values.mean(), values.var(ddof=1)
+
+
 class PhotonTransferCurveExtractConnections(pipeBase.PipelineTaskConnections,
                                             dimensions=("instrument", "detector")):
 
@@ -70,7 +126,14 @@ class PhotonTransferCurveExtractConfig(pipeBase.PipelineTaskConfig,
     )
     covAstierRealSpace = pexConfig.Field(
         dtype=bool,
-        doc="Calculate covariances in real space or via FFT? (see appendix A of Astier+19).",
+        doc="Calculate covariances in real space instead of via FFT? (see appendix A of Astier+19). "
+            "The direct calculation is much slower and is intended for validating the FFT path only.",
+        default=False,
+    )
+    doFftSinglePrecision = pexConfig.Field(
+        dtype=bool,
+        doc="Compute the covariance FFTs in single precision? Roughly halves the memory traffic "
+            "of the transforms at the cost of some precision in the covariances.",
         default=False,
     )
     binSize = pexConfig.Field(
@@ -101,12 +164,12 @@ class PhotonTransferCurveExtractConfig(pipeBase.PipelineTaskConfig,
     )
     nSigmaClipPtc = pexConfig.Field(
         dtype=float,
-        doc="Sigma cut for afwMath.StatisticsControl()",
+        doc="Sigma cut for the clipped mean and variance measurements.",
         default=5.5,
     )
     nIterSigmaClipPtc = pexConfig.Field(
         dtype=int,
-        doc="Number of sigma-clipping iterations for afwMath.StatisticsControl()",
+        doc="Number of sigma-clipping iterations for the clipped mean and variance measurements.",
         default=1,
     )
     minNumberGoodPixelsForFft = pexConfig.Field(
@@ -134,7 +197,7 @@ class PhotonTransferCurveExtractTask(pipeBase.PipelineTask,
     those flats are discarded). The mean, variance, and
     covariances are measured from the difference of the flat
     pairs at a given time. The variance is calculated
-    via afwMath, and the covariance via the methods in Astier+19
+    with iterative sigma clipping, and the covariance via the methods in Astier+19
     (appendix A). In theory, var = covariance[0,0]. This should
     be validated, and in the future, we may decide to just keep
     one (covariance).
@@ -238,6 +301,13 @@ class PhotonTransferCurveExtractTask(pipeBase.PipelineTask,
             dummyPtcDataset.finalVars[ampName] = [np.nan]
             dummyPtcDataset.finalModelVars[ampName] = [np.nan]
             dummyPtcDataset.finalMeans[ampName] = [np.nan]
+        # The amplifier loop below only needs names and fixed measurement
+        # regions, so compute them once rather than per exposure pair.
+        if self.config.detectorMeasurementRegion == 'AMP':
+            ampRegions = [amp.getBBox() for amp in amps]
+        elif self.config.detectorMeasurementRegion == 'FULL':
+            ampRegions = [None]*len(amps)
+        doRealSpace = self.config.covAstierRealSpace
         # Output list with PTC datasets.
         partialDatasetPtcList = []
         # The number of output references needs to match that of input references:
@@ -245,96 +315,111 @@ class PhotonTransferCurveExtractTask(pipeBase.PipelineTask,
         for i in range(len(inputDims)):
             partialDatasetPtcList.append(dummyPtcDataset)
 
-        for expTime in inputExp:
-            exposures = inputExp[expTime]
-            if len(exposures) == 1:
-                self.log.warn(f"Only one exposure found at expTime {expTime}. Dropping exposure "
-                              f"{exposures[0].getInfo().getVisitInfo().getExposureId()}.")
-                continue
-            else:
-                # Only use the first two exposures at expTime
-                exp1, exp2 = exposures[0], exposures[1]
-                if len(exposures) > 2:
-                    self.log.warn(f"Already found 2 exposures at expTime {expTime}. "
-                                  "Ignoring exposures: "
-                                  f"{i.getInfo().getVisitInfo().getExposureId() for i in exposures[2:]}")
-            expId1 = exp1.getInfo().getVisitInfo().getExposureId()
-            expId2 = exp2.getInfo().getVisitInfo().getExposureId()
-            nAmpsNan = 0
-            partialDatasetPtc = PhotonTransferCurveDataset(ampNames, '',
-                                                           self.config.maximumRangeCovariancesAstier)
-            for ampNumber, amp in enumerate(detector):
-                ampName = amp.getName()
-                # covAstier: [(i, j, var (cov[0,0]), cov, npix) for (i,j) in {maxLag, maxLag}^2]
-                doRealSpace = self.config.covAstierRealSpace
-                if self.config.detectorMeasurementRegion == 'AMP':
-                    region = amp.getBBox()
-                elif self.config.detectorMeasurementRegion == 'FULL':
-                    region = None
-                # The variable `covAstier` is of the form: [(i, j, var (cov[0,0]), cov, npix) for (i,j)
-                # in {maxLag, maxLag}^2]
-                muDiff, varDiff, covAstier = self.measureMeanVarCov(exp1, exp2, region=region,
-                                                                    covAstierRealSpace=doRealSpace)
-                expIdMask = True
-                if np.isnan(muDiff) or np.isnan(varDiff) or (covAstier is None):
-                    msg = (f"NaN mean or var, or None cov in amp {ampName} in exposure pair {expId1},"
-                           f" {expId2} of detector {detNum}.")
-                    self.log.warn(msg)
-                    nAmpsNan += 1
-                    expIdMask = False
-                    covArray = np.full((1, self.config.maximumRangeCovariancesAstier,
-                                        self.config.maximumRangeCovariancesAstier), np.nan)
-                    covSqrtWeights = np.full_like(covArray, np.nan)
-
-                if (muDiff <= minMeanSignalDict[ampName]) or (muDiff >= maxMeanSignalDict[ampName]):
-                    expIdMask = False
-
-                partialDatasetPtc.rawExpTimes[ampName] = [expTime]
-                partialDatasetPtc.rawMeans[ampName] = [muDiff]
-                partialDatasetPtc.rawVars[ampName] = [varDiff]
-
-                if covAstier is not None:
-                    tupleRows = [(muDiff, varDiff) + covRow + (ampNumber, expTime,
-                                                               ampName) for covRow in covAstier]
-                    tempStructArray = np.array(tupleRows, dtype=tags)
-                    covArray, vcov, _ = makeCovArray(tempStructArray,
-                                                     self.config.maximumRangeCovariancesAstier)
-                    covSqrtWeights = np.nan_to_num(1./np.sqrt(vcov))
-                partialDatasetPtc.inputExpIdPairs[ampName] = [(expId1, expId2)]
-                partialDatasetPtc.expIdMask[ampName] = [expIdMask]
-                partialDatasetPtc.covariances[ampName] = covArray
-                partialDatasetPtc.covariancesSqrtWeights[ampName] = covSqrtWeights
-                partialDatasetPtc.covariancesModel[ampName] = np.full_like(covArray, np.nan)
-                partialDatasetPtc.covariancesModelNoB[ampName] = np.full_like(covArray, np.nan)
-                partialDatasetPtc.aMatrix[ampName] = np.full_like(covArray[0], np.nan)
-                partialDatasetPtc.bMatrix[ampName] = np.full_like(covArray[0], np.nan)
-                partialDatasetPtc.aMatrixNoB[ampName] = np.full_like(covArray[0], np.nan)
-                partialDatasetPtc.ptcFitPars[ampName] = [np.nan]
-                partialDatasetPtc.ptcFitParsError[ampName] = [np.nan]
-                partialDatasetPtc.ptcFitChiSq[ampName] = np.nan
-                partialDatasetPtc.finalVars[ampName] = [np.nan]
-                partialDatasetPtc.finalModelVars[ampName] = [np.nan]
-                partialDatasetPtc.finalMeans[ampName] = [np.nan]
-            # Use location of exp1 to save PTC dataset from (exp1, exp2) pair.
-            # expId1 and expId2, as returned by getInfo().getVisitInfo().getExposureId(),
-            # and the exposure IDs stured in inoutDims,
-            # may have the zero-padded detector number appended at
-            # the end (in gen3). A temporary fix is to consider expId//1000 and/or
-            # inputDims//1000.
-            # Below, np.where(expId1 == np.array(inputDims)) (and the other analogous
-            # comparisons) returns a tuple with a single-element array, so [0][0]
-            # is necessary to extract the required index.
-            try:
-                datasetIndex = np.where(expId1 == np.array(inputDims))[0][0]
-            except IndexError:
+        # One executor serves every exposure pair; the per-amplifier
+        # measurements within a pair run concurrently (numpy and the afw
+        # statistics release the GIL during the heavy reductions).
+        # Resolve each exposure's ID through VisitInfo once; the loop below
+        # needs them for bookkeeping and several log messages.
+        expIdsAtExpTime = {expTime: [exp.getInfo().getVisitInfo().getExposureId() for exp in exposures]
+                           for expTime, exposures in inputExp.items()}
+        with ThreadPoolExecutor() as executor:
+            for expTime in inputExp:
+                exposures = inputExp[expTime]
+                expIds = expIdsAtExpTime[expTime]
+                if len(exposures) == 1:
+                    self.log.warn(f"Only one exposure found at expTime {expTime}. Dropping exposure "
+                                  f"{expIds[0]}.")
+                    continue
+                else:
+                    # Only use the first two exposures at expTime
+                    exp1, exp2 = exposures[0], exposures[1]
+                    if len(exposures) > 2:
+                        self.log.warn(f"Already found 2 exposures at expTime {expTime}. "
+                                      "Ignoring exposures: "
+                                      f"{expIds[2:]}")
+                expId1, expId2 = expIds[0], expIds[1]
+                nAmpsNan = 0
+                partialDatasetPtc = PhotonTransferCurveDataset(ampNames, '',
+                                                               self.config.maximumRangeCovariancesAstier)
+                # Measure all amplifiers of this pair concurrently; the
+                # bookkeeping below consumes the results in amp order.
+                ampResults = list(executor.map(
+                    lambda region: self.measureMeanVarCov(exp1, exp2, region=region,
+                                                          covAstierRealSpace=doRealSpace),
+                    ampRegions))
+                for ampNumber, (ampName, ampResult) in enumerate(zip(ampNames, ampResults)):
+                    # The variable `covAstier` is of the form: [(i, j, var (cov[0,0]), cov, npix) for (i,j)
+                    # in {maxLag, maxLag}^2]
+                    muDiff, varDiff, covAstier = ampResult
+                    expIdMask = True
+                    # A NaN in either statistic propagates through the sum.
+                    if np.isnan(muDiff + varDiff) or (covAstier is None):
+                        msg = (f"NaN mean or var, or None cov in amp {ampName} in exposure pair {expId1},"
+                               f" {expId2} of detector {detNum}.")
+                        self.log.warn(msg)
+                        nAmpsNan += 1
+                        expIdMask = False
+                        covArray = np.full((1, self.config.maximumRangeCovariancesAstier,
+                                            self.config.maximumRangeCovariancesAstier), np.nan)
+                        covSqrtWeights = np.full_like(covArray, np.nan)
+
+                    if (muDiff <= minMeanSignalDict[ampName]) or (muDiff >= maxMeanSignalDict[ampName]):
+                        expIdMask = False
+
+                    partialDatasetPtc.rawExpTimes[ampName] = [expTime]
+                    partialDatasetPtc.rawMeans[ampName] = [muDiff]
+                    partialDatasetPtc.rawVars[ampName] = [varDiff]
+
+                    if covAstier is not None:
+                        # Fill the record array column-wise from the
+                        # structured covariance results; the per-pair
+                        # scalars broadcast across all lags.
+                        tempStructArray = np.empty(len(covAstier), dtype=tags)
+                        tempStructArray['mu'] = muDiff
+                        tempStructArray['afwVar'] = varDiff
+                        for field in ('i', 'j', 'var', 'cov', 'npix'):
+                            tempStructArray[field] = covAstier[field]
+                        tempStructArray['ext'] = ampNumber
+                        tempStructArray['expTime'] = expTime
+                        tempStructArray['ampName'] = ampName
+                        covArray, vcov, _ = makeCovArray(tempStructArray,
+                                                         self.config.maximumRangeCovariancesAstier)
+                        covSqrtWeights = np.nan_to_num(1./np.sqrt(vcov))
+                    partialDatasetPtc.inputExpIdPairs[ampName] = [(expId1, expId2)]
+                    partialDatasetPtc.expIdMask[ampName] = [expIdMask]
+                    partialDatasetPtc.covariances[ampName] = covArray
+                    partialDatasetPtc.covariancesSqrtWeights[ampName] = covSqrtWeights
+                    partialDatasetPtc.covariancesModel[ampName] = np.full_like(covArray, np.nan)
+                    partialDatasetPtc.covariancesModelNoB[ampName] = np.full_like(covArray, np.nan)
+                    partialDatasetPtc.aMatrix[ampName] = np.full_like(covArray[0], np.nan)
+                    partialDatasetPtc.bMatrix[ampName] = np.full_like(covArray[0], np.nan)
+                    partialDatasetPtc.aMatrixNoB[ampName] = np.full_like(covArray[0], np.nan)
+                    partialDatasetPtc.ptcFitPars[ampName] = [np.nan]
+                    partialDatasetPtc.ptcFitParsError[ampName] = [np.nan]
+                    partialDatasetPtc.ptcFitChiSq[ampName] = np.nan
+                    partialDatasetPtc.finalVars[ampName] = [np.nan]
+                    partialDatasetPtc.finalModelVars[ampName] = [np.nan]
+                    partialDatasetPtc.finalMeans[ampName] = [np.nan]
+                # Use location of exp1 to save PTC dataset from (exp1, exp2) pair.
+                # expId1 and expId2, as returned by getInfo().getVisitInfo().getExposureId(),
+                # and the exposure IDs stured in inoutDims,
+                # may have the zero-padded detector number appended at
+                # the end (in gen3). A temporary fix is to consider expId//1000 and/or
+                # inputDims//1000.
+                # Below, np.where(expId1 == np.array(inputDims)) (and the other analogous
+                # comparisons) returns a tuple with a single-element array, so [0][0]
+                # is necessary to extract the required index.
                 try:
-                    datasetIndex = np.where(expId1//1000 == np.array(inputDims))[0][0]
+                    datasetIndex = np.where(expId1 == np.array(inputDims))[0][0]
                 except IndexError:
-                    datasetIndex = np.where(expId1//1000 == np.array(inputDims)//1000)[0][0]
-            partialDatasetPtcList[datasetIndex] = partialDatasetPtc
-            if nAmpsNan == len(ampNames):
-                msg = f"NaN mean in all amps of exposure pair {expId1}, {expId2} of detector {detNum}."
-                self.log.warn(msg)
+                    try:
+                        datasetIndex = np.where(expId1//1000 == np.array(inputDims))[0][0]
+                    except IndexError:
+                        datasetIndex = np.where(expId1//1000 == np.array(inputDims)//1000)[0][0]
+                partialDatasetPtcList[datasetIndex] = partialDatasetPtc
+                if nAmpsNan == len(ampNames):
+                    msg = f"NaN mean in all amps of exposure pair {expId1}, {expId2} of detector {detNum}."
+                    self.log.warn(msg)
         return pipeBase.Struct(
             outputCovariances=partialDatasetPtcList,
         )
@@ -342,7 +427,7 @@ class PhotonTransferCurveExtractTask(pipeBase.PipelineTask,
     def measureMeanVarCov(self, exposure1, exposure2, region=None, covAstierRealSpace=False):
         """Calculate the mean of each of two exposures and the variance
         and covariance of their difference. The variance is calculated
-        via afwMath, and the covariance via the methods in Astier+19
+        with iterative sigma clipping, and the covariance via the methods in Astier+19
         (appendix A). In theory, var = covariance[0,0]. This should
         be validated, and in the future, we may decide to just keep
         one (covariance).
@@ -367,19 +452,19 @@ class PhotonTransferCurveExtractTask(pipeBase.PipelineTask,
         varDiff : `float` or `NaN`
             Half of the clipped variance of the difference of the regions inthe two input
             exposures. If either mu1 or m2 are NaN's, the returned value is NaN.
-        covDiffAstier : `list` or `NaN`
-            List with tuples of the form (dx, dy, var, cov, npix), where:
-                dx : `int`
+        covDiffAstier : `numpy.ndarray` or `None`
+            Structured array with records of the form (i, j, var, cov, npix), where:
+                i : `int`
                     Lag in x
-                dy : `int`
+                j : `int`
                     Lag in y
                 var : `float`
-                    Variance at (dx, dy).
+                    Variance at lag (0, 0).
                 cov : `float`
-                    Covariance at (dx, dy).
-                nPix : `int`
+                    Covariance at (i, j).
+                npix : `int`
                     Number of pixel pairs used to evaluate var and cov.
-            If either mu1 or m2 are NaN's, the returned value is NaN.
+            If either mu1 or m2 are NaN's, the returned value is None.
         """
 
         if region is not None:
@@ -393,53 +478,45 @@ class PhotonTransferCurveExtractTask(pipeBase.PipelineTask,
             im1Area = afwMath.binImage(im1Area, self.config.binSize)
             im2Area = afwMath.binImage(im2Area, self.config.binSize)
 
-        im1MaskVal = exposure1.getMask().getPlaneBitMask(self.config.maskNameList)
-        im1StatsCtrl = afwMath.StatisticsControl(self.config.nSigmaClipPtc,
-                                                 self.config.nIterSigmaClipPtc,
-                                                 im1MaskVal)
-        im1StatsCtrl.setNanSafe(True)
-        im1StatsCtrl.setAndMask(im1MaskVal)
+        # Both exposures use the standard mask plane dictionary, so one
+        # bit mask selects the statistics pixels in the two images and
+        # their difference.
+        imMaskVal = exposure1.getMask().getPlaneBitMask(self.config.maskNameList)
+        nSigmaClip = self.config.nSigmaClipPtc
+        nIterClip = self.config.nIterSigmaClipPtc
 
-        im2MaskVal = exposure2.getMask().getPlaneBitMask(self.config.maskNameList)
-        im2StatsCtrl = afwMath.StatisticsControl(self.config.nSigmaClipPtc,
-                                                 self.config.nIterSigmaClipPtc,
-                                                 im2MaskVal)
-        im2StatsCtrl.setNanSafe(True)
-        im2StatsCtrl.setAndMask(im2MaskVal)
+        im1Arr = im1Area.image.array
+        im2Arr = im2Area.image.array
+        m1 = im1Area.mask.array
+        m2 = im2Area.mask.array
 
         #  Clipped mean of images; then average of mean.
-        mu1 = afwMath.makeStatistics(im1Area, afwMath.MEANCLIP, im1StatsCtrl).getValue()
-        mu2 = afwMath.makeStatistics(im2Area, afwMath.MEANCLIP, im2StatsCtrl).getValue()
-        if np.isnan(mu1) or np.isnan(mu2):
+        mu1, _ = _sigmaClippedMeanVar(im1Arr[(m1 & imMaskVal) == 0], nSigmaClip, nIterClip)
+        mu2, _ = _sigmaClippedMeanVar(im2Arr[(m2 & imMaskVal) == 0], nSigmaClip, nIterClip)
+        mu = 0.5*(mu1 + mu2)
+        # A NaN in either mean propagates into mu, and only NaN fails the
+        # self-comparison, so one test covers both inputs.
+        if mu != mu:
             self.log.warn(f"Mean of amp in image 1 or 2 is NaN: {mu1}, {mu2}.")
             return np.nan, np.nan, None
-        mu = 0.5*(mu1 + mu2)
 
         # Take difference of pairs
         # symmetric formula: diff = (mu2*im1-mu1*im2)/(0.5*(mu1+mu2))
-        temp = im2Area.clone()
-        temp *= mu1
-        diffIm = im1Area.clone()
-        diffIm *= mu2
-        diffIm -= temp
-        diffIm /= mu
-
-        diffImMaskVal = diffIm.getMask().getPlaneBitMask(self.config.maskNameList)
-        diffImStatsCtrl = afwMath.StatisticsControl(self.config.nSigmaClipPtc,
-                                                    self.config.nIterSigmaClipPtc,
-                                                    diffImMaskVal)
-        diffImStatsCtrl.setNanSafe(True)
-        diffImStatsCtrl.setAndMask(diffImMaskVal)
-
-        varDiff = 0.5*(afwMath.makeStatistics(diffIm, afwMath.VARIANCECLIP, diffImStatsCtrl).getValue())
+        # Work directly on the pixel arrays, folding the 1/mu
+        # normalization into the two scalar factors; the difference mask
+        # is the OR of the two input masks.
+        diffArr = im1Arr*(mu2/mu)
+        diffArr -= (mu1/mu)*im2Arr
+        diffMask = m1 | m2
 
-        # Get the mask and identify good pixels as '1', and the rest as '0'.
-        w1 = np.where(im1Area.getMask().getArray() == 0, 1, 0)
-        w2 = np.where(im2Area.getMask().getArray() == 0, 1, 0)
+        _, diffVar = _sigmaClippedMeanVar(diffArr[(diffMask & imMaskVal) == 0], nSigmaClip, nIterClip)
+        varDiff = 0.5*diffVar
 
-        w12 = w1*w2
-        wDiff = np.where(diffIm.getMask().getArray() == 0, 1, 0)
-        w = w12*wDiff
+        # Get the mask and identify good pixels as '1', and the rest as '0'.
+        # A single comparison against the ORed mask flags the pixels that
+        # are good in im1, im2 and the difference; uint8 keeps the weight
+        # image at one byte per pixel.
+        w = (diffMask == 0).astype(np.uint8)
 
         if np.sum(w) < self.config.minNumberGoodPixelsForFft:
             self.log.warn(f"Number of good points for FFT ({np.sum(w)}) is less than threshold "
@@ -448,11 +525,23 @@ class PhotonTransferCurveExtractTask(pipeBase.PipelineTask,
 
         maxRangeCov = self.config.maximumRangeCovariancesAstier
         if covAstierRealSpace:
-            covDiffAstier = computeCovDirect(diffIm.image.array, w, maxRangeCov)
+            covDiffAstier = computeCovDirect(diffArr, w, maxRangeCov)
         else:
-            shapeDiff = diffIm.image.array.shape
-            fftShape = (fftSize(shapeDiff[0] + maxRangeCov), fftSize(shapeDiff[1]+maxRangeCov))
-            c = CovFft(diffIm.image.array, w, fftShape, maxRangeCov)
+            if self.config.doFftSinglePrecision:
+                # Cast both inputs to float32 (integer weights would be
+                # promoted to float64 by the transform) so the FFTs run
+                # in single precision; reportCovFft promotes the
+                # gathered per-lag sums back to float64 before the
+                # subtraction.
+                diffArr = diffArr.astype(np.float32, copy=False)
+                wFft = w.astype(np.float32)
+            else:
+                # Promote the weights so the transforms run in double
+                # precision.
+                wFft = w.astype(np.float64)
+            shapeDiff = diffArr.shape
+            fftShape = _fftShapeFor(shapeDiff[0], shapeDiff[1], maxRangeCov)
+            c = CovFft(diffArr, wFft, fftShape, maxRangeCov)
             covDiffAstier = c.reportCovFft(maxRangeCov)
 
         return mu, varDiff, covDiffAstier
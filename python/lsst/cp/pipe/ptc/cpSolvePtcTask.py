@@ -20,11 +20,11 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 import numpy as np
-from collections import Counter
 
 import lsst.pex.config as pexConfig
 import lsst.pipe.base as pipeBase
-from lsst.cp.pipe.utils import (fitLeastSq, fitBootstrap, funcPolynomial, funcAstier)
+from lsst.cp.pipe.utils import (fitLeastSq, fitBootstrap, fitPolynomialLeastSquares,
+                                funcPolynomial, funcAstier)
 
 from scipy.optimize import least_squares
 
@@ -113,6 +113,16 @@ class PhotonTransferCurveSolveConfig(pipeBase.PipelineTaskConfig,
         doc="Maximum number of iterations for outlier rejection in PTC.",
         default=2,
     )
+    ptcOutlierFitLoss = pexConfig.ChoiceField(
+        dtype=str,
+        doc="Loss function for the outlier-rejection fits in the PTC.",
+        default='linear',
+        allowed={
+            "linear": "Standard least squares.",
+            "soft_l1": "Robust loss (scaled by sigmaCutPtcOutliers) that down-weights outliers, "
+                       "typically converging in fewer rejection iterations.",
+        }
+    )
     initialNonLinearityExclusionThresholdPositive = pexConfig.RangeField(
         dtype=float,
         doc="Initially exclude data points with a variance that are more than a factor of this from being"
@@ -214,36 +224,29 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
         ampNames = np.unique(inputCovariances[0].ampNames)
         datasetPtc = PhotonTransferCurveDataset(ampNames, self.config.ptcFitType,
                                                 self.config.maximumRangeCovariancesAstier)
-        for partialPtcDataset in inputCovariances:
-            if partialPtcDataset.ptcFitType == 'DUMMY':
-                continue
-            for ampName in ampNames:
-                datasetPtc.inputExpIdPairs[ampName].append(partialPtcDataset.inputExpIdPairs[ampName])
-                if type(partialPtcDataset.rawExpTimes[ampName]) is list:
-                    datasetPtc.rawExpTimes[ampName].append(partialPtcDataset.rawExpTimes[ampName][0])
-                else:
-                    datasetPtc.rawExpTimes[ampName].append(partialPtcDataset.rawExpTimes[ampName])
-                if type(partialPtcDataset.rawMeans[ampName]) is list:
-                    datasetPtc.rawMeans[ampName].append(partialPtcDataset.rawMeans[ampName][0])
-                else:
-                    datasetPtc.rawMeans[ampName].append(partialPtcDataset.rawMeans[ampName])
-                if type(partialPtcDataset.rawVars[ampName]) is list:
-                    datasetPtc.rawVars[ampName].append(partialPtcDataset.rawVars[ampName][0])
-                else:
-                    datasetPtc.rawVars[ampName].append(partialPtcDataset.rawVars[ampName])
-                datasetPtc.covariances[ampName].append(np.array(partialPtcDataset.covariances[ampName][0]))
-                datasetPtc.covariancesSqrtWeights[ampName].append(
-                    np.array(partialPtcDataset.covariancesSqrtWeights[ampName][0]))
-        # Sort arrays that are filled so far in the final dataset by rawMeans index
+        # Filter out the dummy placeholders once, then build each column with
+        # a single pass per amplifier instead of appending pair by pair.
+        goodCovList = [partialPtcDataset for partialPtcDataset in inputCovariances
+                       if partialPtcDataset.ptcFitType != 'DUMMY']
         for ampName in ampNames:
-            index = np.argsort(np.ravel(np.array(datasetPtc.rawMeans[ampName])))
-            datasetPtc.inputExpIdPairs[ampName] = np.array(datasetPtc.inputExpIdPairs[ampName])[index]
-            datasetPtc.rawExpTimes[ampName] = np.array(datasetPtc.rawExpTimes[ampName])[index]
-            datasetPtc.rawMeans[ampName] = np.array(datasetPtc.rawMeans[ampName])[index]
-            datasetPtc.rawVars[ampName] = np.array(datasetPtc.rawVars[ampName])[index]
-            datasetPtc.covariances[ampName] = np.array(datasetPtc.covariances[ampName])[index]
-            datasetPtc.covariancesSqrtWeights[ampName] = np.array(
-                datasetPtc.covariancesSqrtWeights[ampName])[index]
+            inputExpIdPairs = np.array([partial.inputExpIdPairs[ampName] for partial in goodCovList])
+            # np.ravel()[0] handles both the scalar and single-element-list
+            # forms the partial datasets come in.
+            rawExpTimes = np.array([np.ravel(partial.rawExpTimes[ampName])[0]
+                                    for partial in goodCovList])
+            rawMeans = np.array([np.ravel(partial.rawMeans[ampName])[0] for partial in goodCovList])
+            rawVars = np.array([np.ravel(partial.rawVars[ampName])[0] for partial in goodCovList])
+            covariances = np.array([partial.covariances[ampName][0] for partial in goodCovList])
+            covariancesSqrtWeights = np.array([partial.covariancesSqrtWeights[ampName][0]
+                                               for partial in goodCovList])
+            # Sort the assembled arrays by raw mean signal.
+            index = np.argsort(rawMeans)
+            datasetPtc.inputExpIdPairs[ampName] = inputExpIdPairs[index]
+            datasetPtc.rawExpTimes[ampName] = rawExpTimes[index]
+            datasetPtc.rawMeans[ampName] = rawMeans[index]
+            datasetPtc.rawVars[ampName] = rawVars[index]
+            datasetPtc.covariances[ampName] = covariances[index]
+            datasetPtc.covariancesSqrtWeights[ampName] = covariancesSqrtWeights[index]
 
         if self.config.ptcFitType == "FULLCOVARIANCE":
             # Calculate covariances and fit them, including the PTC, to Astier+19 full model (Eq. 20)
@@ -330,25 +333,25 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
                 fitNoB = covFitsNoB[amp]
                 # Save full covariances, covariances models, and their weights
                 # dataset.expIdMask is already full
+                covModel = fit.evalCovModel()
                 dataset.covariances[amp] = fit.cov
-                dataset.covariancesModel[amp] = fit.evalCovModel()
+                dataset.covariancesModel[amp] = covModel
                 dataset.covariancesSqrtWeights[amp] = fit.sqrtW
                 dataset.aMatrix[amp] = fit.getA()
                 dataset.bMatrix[amp] = fit.getB()
                 dataset.covariancesModelNoB[amp] = fitNoB.evalCovModel()
                 dataset.aMatrixNoB[amp] = fitNoB.getA()
 
-                (meanVecFinal, varVecFinal, varVecModel,
-                    wc, varMask) = fit.getFitData(0, 0, divideByMu=False)
-                gain = fit.getGain()
-
-                dataset.gain[amp] = gain
+                dataset.gain[amp] = fit.getGain()
                 dataset.gainErr[amp] = fit.getGainErr()
                 dataset.noise[amp] = np.sqrt(fit.getRon())
                 dataset.noiseErr[amp] = fit.getRonErr()
-                dataset.finalVars[amp] = varVecFinal
-                dataset.finalModelVars[amp] = varVecModel
-                dataset.finalMeans[amp] = meanVecFinal
+                # The (0, 0) fit data in ADU are slices of the arrays
+                # already in hand, so there is no need to re-evaluate the
+                # model through fit.getFitData.
+                dataset.finalVars[amp] = fit.cov[:, 0, 0]
+                dataset.finalModelVars[amp] = covModel[:, 0, 0]
+                dataset.finalMeans[amp] = fit.mu
 
             else:
                 # Bad amp
@@ -447,25 +450,27 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
         This function also masks points after the variance starts decreasing.
         """
 
+        means = np.asarray(means)
+        variances = np.asarray(variances)
         assert(len(means) == len(variances))
-        ratios = [b/a for (a, b) in zip(means, variances)]
+        ratios = variances/means
         medianRatio = np.nanmedian(ratios)
-        ratioDeviations = [0.0 if a < minMeanRatioTest else (r/medianRatio)-1
-                           for (a, r) in zip(means, ratios)]
+        # Points below the signal threshold are not tested, so give them a
+        # zero deviation to keep them in the good set.
+        ratioDeviations = np.where(means < minMeanRatioTest, 0.0, ratios/medianRatio - 1)
 
         # so that it doesn't matter if the deviation is expressed as positive or negative
         maxDeviationPositive = abs(maxDeviationPositive)
         maxDeviationNegative = -1. * abs(maxDeviationNegative)
 
-        goodPoints = np.array([True if (r < maxDeviationPositive and r > maxDeviationNegative)
-                              else False for r in ratioDeviations])
+        goodPoints = (ratioDeviations < maxDeviationPositive) & (ratioDeviations > maxDeviationNegative)
 
         # Eliminate points beyond which the variance decreases
-        pivot = np.where(np.array(np.diff(variances)) < 0)[0]
+        pivot = np.where(np.diff(variances) < 0)[0]
         if len(pivot) > 0:
             # For small values, sometimes the variance decreases slightly
             # Only look when var > self.config.minVarPivotSearch
-            pivot = [p for p in pivot if variances[p] > minVarPivotSearch]
+            pivot = pivot[variances[pivot] > minVarPivotSearch]
             if len(pivot) > 0:
                 pivot = np.min(pivot)
                 goodPoints[pivot+1:len(goodPoints)] = False
@@ -475,14 +480,14 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
     def _makeZeroSafe(self, array, substituteValue=1e-9):
         """"""
         array = np.array(array)
-        nBad = Counter(np.ravel(array))[0]
+        zeros = array == 0
+        nBad = np.count_nonzero(zeros)
         if nBad == 0:
             return array
 
-        index, = np.where(array == 0)
-        if len(index):
-            msg = f"Found {nBad} zeros in array at elements {index}"
-            self.log.warn(msg)
+        index, = np.where(zeros)
+        msg = f"Found {nBad} zeros in array at elements {index}"
+        self.log.warn(msg)
 
         array[index] = substituteValue
 
@@ -540,11 +545,19 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
             dataset.covariancesModelNoB[amp] = listNanMatrix
             dataset.aMatrixNoB[amp] = nanMatrix
 
-        def errFunc(p, x, y):
-            return ptcFunc(p, x) - y
+        def errFunc(p, x, y, w):
+            return (ptcFunc(p, x) - y)*w
 
+        # Hoist the config reads used on every amp out of the loop.
         sigmaCutPtcOutliers = self.config.sigmaCutPtcOutliers
         maxIterationsPtcOutliers = self.config.maxIterationsPtcOutliers
+        outlierFitLoss = self.config.ptcOutlierFitLoss
+        exclusionThresholdPositive = self.config.initialNonLinearityExclusionThresholdPositive
+        exclusionThresholdNegative = self.config.initialNonLinearityExclusionThresholdNegative
+        minMeanRatioTest = self.config.minMeanRatioTest
+        minVarPivotSearch = self.config.minVarPivotSearch
+        polynomialFitDegree = self.config.polynomialFitDegree
+        doFitBootstrap = self.config.doFitBootstrap
 
         for i, ampName in enumerate(dataset.ampNames):
             timeVecOriginal = np.ravel(np.array(dataset.rawExpTimes[ampName]))
@@ -553,10 +566,10 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
             varVecOriginal = self._makeZeroSafe(varVecOriginal)
 
             goodPoints = self._getInitialGoodPoints(meanVecOriginal, varVecOriginal,
-                                                    self.config.initialNonLinearityExclusionThresholdPositive,
-                                                    self.config.initialNonLinearityExclusionThresholdNegative,
-                                                    self.config.minMeanRatioTest,
-                                                    self.config.minVarPivotSearch)
+                                                    exclusionThresholdPositive,
+                                                    exclusionThresholdNegative,
+                                                    minMeanRatioTest,
+                                                    minVarPivotSearch)
             if not (goodPoints.any()):
                 msg = (f"SERIOUS: All points in goodPoints: {goodPoints} are bad."
                        f"Setting {ampName} to BAD.")
@@ -575,25 +588,39 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
                                                uppers=[1e-4, 2.5, 2000])
             if ptcFitType == 'POLYNOMIAL':
                 ptcFunc = funcPolynomial
-                parsIniPtc = self._initialParsForPolynomial(self.config.polynomialFitDegree + 1)
+                parsIniPtc = self._initialParsForPolynomial(polynomialFitDegree + 1)
                 bounds = self._boundsForPolynomial(parsIniPtc)
 
             # Before bootstrap fit, do an iterative fit to get rid of outliers
             count = 1
+            # The residual normalization does not depend on the mask, so
+            # compute it once for all rejection iterations.
+            sqrtVarVec = np.sqrt(varVecOriginal)
             while count <= maxIterationsPtcOutliers:
-                # Note that application of the mask actually shrinks the array
-                # to size rather than setting elements to zero (as we want) so
-                # always update mask itself and re-apply to the original data
-                meanTempVec = meanVecOriginal[mask]
-                varTempVec = varVecOriginal[mask]
-                res = least_squares(errFunc, parsIniPtc, bounds=bounds, args=(meanTempVec, varTempVec))
+                # Masked points enter the fit with zero weight and their
+                # data zeroed, so the arrays keep their full length and
+                # NaNs from failed exposure pairs never reach the
+                # optimizer, which requires every residual to be finite.
+                meanVecFit = np.where(mask, meanVecOriginal, 0.0)
+                varVecFit = np.where(mask, varVecOriginal, 0.0)
+                if outlierFitLoss == 'linear':
+                    fitWeights = mask.astype(float)
+                else:
+                    # The robust losses compare the residuals against
+                    # f_scale, which is in sigma units, so normalize them
+                    # by the per-point noise.
+                    fitWeights = np.where(mask, 1.0/sqrtVarVec, 0.0)
+                res = least_squares(errFunc, parsIniPtc, bounds=bounds,
+                                    loss=outlierFitLoss,
+                                    f_scale=sigmaCutPtcOutliers,
+                                    args=(meanVecFit, varVecFit, fitWeights))
                 pars = res.x
 
-                # change this to the original from the temp because the masks are ANDed
-                # meaning once a point is masked it's always masked, and the masks must
-                # always be the same length for broadcasting
-                sigResids = (varVecOriginal - ptcFunc(pars, meanVecOriginal))/np.sqrt(varVecOriginal)
-                newMask = np.array([True if np.abs(r) < sigmaCutPtcOutliers else False for r in sigResids])
+                sigResids = (varVecOriginal - ptcFunc(pars, meanVecOriginal))/sqrtVarVec
+                newMask = np.abs(sigResids) < sigmaCutPtcOutliers
+                # the masks are ANDed, meaning once a point is masked it's
+                # always masked
+                previousMask = mask
                 mask = mask & newMask
                 if not (mask.any() and newMask.any()):
                     msg = (f"SERIOUS: All points in either mask: {mask} or newMask: {newMask} are bad. "
@@ -602,11 +629,15 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
                     # Fill entries with NaNs
                     self.fillBadAmp(dataset, ptcFitType, ampName)
                     break
-                nDroppedTotal = Counter(mask)[False]
+                nDroppedTotal = np.count_nonzero(~mask)
                 self.log.debug(f"Iteration {count}: discarded {nDroppedTotal} points in total for {ampName}")
                 count += 1
                 # objects should never shrink
                 assert (len(mask) == len(timeVecOriginal) == len(meanVecOriginal) == len(varVecOriginal))
+                if np.array_equal(mask, previousMask):
+                    # No further points were discarded, so another pass
+                    # would refit the same data.
+                    break
             if not (mask.any() and newMask.any()):
                 continue
             dataset.expIdMask[ampName] = mask  # store the final mask
@@ -614,9 +645,10 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
             meanVecFinal = meanVecOriginal[mask]
             varVecFinal = varVecOriginal[mask]
 
-            if Counter(mask)[False] > 0:
+            nDropped = np.count_nonzero(~mask)
+            if nDropped > 0:
                 self.log.info((f"Number of points discarded in PTC of amplifier {ampName}:" +
-                               f" {Counter(mask)[False]} out of {len(meanVecOriginal)}"))
+                               f" {nDropped} out of {len(meanVecOriginal)}"))
 
             if (len(meanVecFinal) < len(parsIniPtc)):
                 msg = (f"SERIOUS: Not enough data points ({len(meanVecFinal)}) compared to the number of "
@@ -626,14 +658,21 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
                 self.fillBadAmp(dataset, ptcFitType, ampName)
                 continue
             # Fit the PTC
-            if self.config.doFitBootstrap:
+            weightsY = 1./sqrtVarVec[mask]
+            if doFitBootstrap:
                 parsFit, parsFitErr, reducedChiSqPtc = fitBootstrap(parsIniPtc, meanVecFinal,
                                                                     varVecFinal, ptcFunc,
-                                                                    weightsY=1./np.sqrt(varVecFinal))
+                                                                    weightsY=weightsY)
+            elif ptcFitType == 'POLYNOMIAL':
+                # Linear in its parameters, so a direct weighted solve
+                # replaces the iterative optimizer.
+                parsFit, parsFitErr, reducedChiSqPtc = fitPolynomialLeastSquares(
+                    meanVecFinal, varVecFinal, polynomialFitDegree,
+                    weightsY=weightsY)
             else:
                 parsFit, parsFitErr, reducedChiSqPtc = fitLeastSq(parsIniPtc, meanVecFinal,
                                                                   varVecFinal, ptcFunc,
-                                                                  weightsY=1./np.sqrt(varVecFinal))
+                                                                  weightsY=weightsY)
             dataset.ptcFitPars[ampName] = parsFit
             dataset.ptcFitParsError[ampName] = parsFitErr
             dataset.ptcFitChiSq[ampName] = reducedChiSqPtc
@@ -649,13 +688,16 @@ class PhotonTransferCurveSolveTask(pipeBase.PipelineTask,
             if ptcFitType == 'EXPAPPROXIMATION':
                 ptcGain = parsFit[1]
                 ptcGainErr = parsFitErr[1]
-                ptcNoise = np.sqrt(np.fabs(parsFit[2]))
-                ptcNoiseErr = 0.5*(parsFitErr[2]/np.fabs(parsFit[2]))*np.sqrt(np.fabs(parsFit[2]))
+                absNoiseSq = np.fabs(parsFit[2])
+                ptcNoise = np.sqrt(absNoiseSq)
+                ptcNoiseErr = 0.5*(parsFitErr[2]/absNoiseSq)*ptcNoise
             if ptcFitType == 'POLYNOMIAL':
                 ptcGain = 1./parsFit[1]
                 ptcGainErr = np.fabs(1./parsFit[1])*(parsFitErr[1]/parsFit[1])
-                ptcNoise = np.sqrt(np.fabs(parsFit[0]))*ptcGain
-                ptcNoiseErr = (0.5*(parsFitErr[0]/np.fabs(parsFit[0]))*(np.sqrt(np.fabs(parsFit[0]))))*ptcGain
+                absC0 = np.fabs(parsFit[0])
+                sqrtAbsC0 = np.sqrt(absC0)
+                ptcNoise = sqrtAbsC0*ptcGain
+                ptcNoiseErr = (0.5*(parsFitErr[0]/absC0)*sqrtAbsC0)*ptcGain
             dataset.gain[ampName] = ptcGain
             dataset.gainErr[ampName] = ptcGainErr
             dataset.noise[ampName] = ptcNoise
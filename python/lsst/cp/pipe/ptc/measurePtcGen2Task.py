@@ -25,8 +25,6 @@ import lsst.pex.config as pexConfig
 import lsst.pipe.base as pipeBase
 from lsst.cp.pipe.utils import arrangeFlatsByExpTime
 
-from .photodiode import getBOTphotodiodeData
-
 from lsst.pipe.tasks.getRepositoryData import DataRefListRunner
 from lsst.cp.pipe.ptc.cpExtractPtcTask import PhotonTransferCurveExtractTask
 from lsst.cp.pipe.ptc.cpSolvePtcTask import PhotonTransferCurveSolveTask
@@ -182,9 +180,17 @@ class MeasurePhotonTransferCurveTask(pipeBase.CmdLineTask):
             attribute.
         """
         if self.config.doPhotodiode:
-            for (expId1, expId2) in expIdList:
-                charges = [-1, -1]  # necessary to have a not-found value to keep lists in step
-                for i, expId in enumerate([expId1, expId2]):
+            # Only needed when photodiode corrections are requested, so
+            # defer the import until then.
+            from .photodiode import getBOTphotodiodeData
+            # -1 is the not-found value, to keep the pairs in step.
+            photoCharges = np.full((len(expIdList), 2), -1.0)
+            chargeCache = {}
+
+            def photoChargeFor(expId):
+                # An exposure can appear in more than one pair; read its
+                # photodiode data only once.
+                if expId not in chargeCache:
                     # //1000 is a Gen2 only hack, working around the fact an
                     # exposure's ID is not the same as the expId in the
                     # registry. Currently expId is concatenated with the
@@ -195,14 +201,24 @@ class MeasurePhotonTransferCurveTask(pipeBase.CmdLineTask):
                     else:
                         photodiodeData = getBOTphotodiodeData(dataRef)
                     if photodiodeData:  # default path stored in function def to keep task clean
-                        charges[i] = photodiodeData.getCharge()
+                        chargeCache[expId] = photodiodeData.getCharge()
                     else:
                         # full expId (not //1000) here, as that encodes the
                         # the detector number as so is fully qualifying
                         self.log.warn(f"No photodiode data found for {expId}")
+                        chargeCache[expId] = -1.0
+                return chargeCache[expId]
+
+            for pairIndex, (expId1, expId2) in enumerate(expIdList):
+                photoCharges[pairIndex, 0] = photoChargeFor(expId1)
+                photoCharges[pairIndex, 1] = photoChargeFor(expId2)
+            if not (photoCharges >= 0).any():
+                self.log.warn("No photodiode data found for any input exposure.")
 
-                for ampName in datasetPtc.ampNames:
-                    datasetPtc.photoCharge[ampName].append((charges[0], charges[1]))
+            # The charges do not depend on the amplifier, so the assembled
+            # array is shared by all of them.
+            for ampName in datasetPtc.ampNames:
+                datasetPtc.photoCharge[ampName] = photoCharges
         else:
             # Can't be an empty list, as initialized, because astropy.Table won't allow it
             # when saving as fits
@@ -23,17 +23,12 @@
 __all__ = ['PlotPhotonTransferCurveTask']
 
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-from matplotlib import gridspec
 import os
-from matplotlib.backends.backend_pdf import PdfPages
 
 import lsst.ip.isr as isr
 
 from lsst.cp.pipe.utils import (funcAstier, funcPolynomial,
                                 calculateWeightedReducedChi2)
-from matplotlib.ticker import MaxNLocator
 
 from lsst.cp.pipe.ptc.astierCovPtcFit import computeApproximateAcoeffs
 from lsst.cp.pipe.ptc.astierCovPtcUtils import getFitDataFromCovariances
@@ -119,6 +114,7 @@ class PlotPhotonTransferCurveTask():
 
     def run(self, filenameFull, datasetPtc, linearizer=None, log=None):
         """Make the plots for the PTC task"""
+        from matplotlib.backends.backend_pdf import PdfPages
         ptcFitType = datasetPtc.ptcFitType
         with PdfPages(filenameFull) as pdfPages:
             if ptcFitType in ["FULLCOVARIANCE", ]:
@@ -236,6 +232,7 @@ class PlotPhotonTransferCurveTask():
         pdfPages: `matplotlib.backends.backend_pdf.PdfPages`
             PDF file where the plots will be saved.
         """
+        import matplotlib.pyplot as plt
 
         legendFontSize = 6.5
         labelFontSize = 7
@@ -459,6 +456,8 @@ class PlotPhotonTransferCurveTask():
         log : `lsst.log.Log`, optional
             Logger to handle messages.
         """
+        import matplotlib.pyplot as plt
+        from matplotlib import gridspec
         if not topPlot:
             fig = plt.figure(figsize=(8, 10))
             gs = gridspec.GridSpec(2, 1, height_ratios=[3, 1])
@@ -571,6 +570,9 @@ class PlotPhotonTransferCurveTask():
         bRange : `int`
             Maximum lag for b arrays.
         """
+        import matplotlib as mpl
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import MaxNLocator
         a, b = [], []
         for amp in aDict:
             if np.isnan(aDict[amp]).all():
@@ -624,6 +626,7 @@ class PlotPhotonTransferCurveTask():
         bRange : `int`
             Maximum lag for b arrays.
         """
+        import matplotlib.pyplot as plt
         assert (len(aDict) == len(bDict))
         a = []
         for amp in aDict:
@@ -705,6 +708,7 @@ class PlotPhotonTransferCurveTask():
         pdfPages: `matplotlib.backends.backend_pdf.PdfPages`
             PDF file where the plots will be saved.
         """
+        import matplotlib.pyplot as plt
         assert (len(aDict) == len(bDict))
         a, b = [], []
         for amp in aDict:
@@ -771,6 +775,8 @@ class PlotPhotonTransferCurveTask():
         maxr : `int`, optional
             Maximum lag.
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import MaxNLocator
 
         fig = plt.figure(figsize=(7, 11))
         title = [f"'a' relative bias at {signalElectrons} e", "'a' relative bias (b=0)"]
@@ -823,6 +829,7 @@ class PlotPhotonTransferCurveTask():
         pdfPages: `matplotlib.backends.backend_pdf.PdfPages`
             PDF file where the plots will be saved.
         """
+        import matplotlib.pyplot as plt
 
         if ptcFitType == 'EXPAPPROXIMATION':
             ptcFunc = funcAstier
@@ -972,6 +979,7 @@ class PlotPhotonTransferCurveTask():
         linearizer : `lsst.ip.isr.Linearizer`
             Linearizer object
         """
+        import matplotlib.pyplot as plt
         legendFontSize = 7
         labelFontSize = 7
         titleFontSize = 9
@@ -385,9 +385,25 @@ def fitLeastSq(initialParams, dataX, dataY, function, weightsY=None):
             weightsY = np.ones(len(x))
         return (function(p, x) - y)*weightsY
 
+    # The Jacobians of the known model functions are available in closed
+    # form, which saves the optimizer one finite-difference residual
+    # evaluation per parameter per step.
+    if function is funcPolynomial:
+        jacFunction = _jacFuncPolynomial
+    elif function is funcAstier:
+        jacFunction = _jacFuncAstier
+    else:
+        jacFunction = None
+
+    if jacFunction is not None:
+        def jacErrFunc(p, x, y, weightsY):
+            return jacFunction(p, x)*weightsY[:, np.newaxis]
+    else:
+        jacErrFunc = None
+
     pFit, pCov, infoDict, errMessage, success = leastsq(errFunc, initialParams,
                                                         args=(dataX, dataY, weightsY), full_output=1,
-                                                        epsfcn=0.0001)
+                                                        Dfun=jacErrFunc, epsfcn=0.0001)
 
     if (len(dataY) > len(initialParams)) and pCov is not None:
         reducedChiSq = calculateWeightedReducedChi2(dataY, function(pFit, dataX), weightsY, len(dataY),
@@ -408,6 +424,60 @@ def fitLeastSq(initialParams, dataX, dataY, function, weightsY=None):
     return pFitSingleLeastSquares, pErrSingleLeastSquares, reducedChiSq
 
 
+def fitPolynomialLeastSquares(dataX, dataY, degree, weightsY=None):
+    """Fit a polynomial with a direct weighted linear least-squares solve.
+
+    The polynomial model is linear in its parameters, so the fit does not
+    need an iterative optimizer: a single solve of the weighted Vandermonde
+    system gives the minimum-chi2 parameters.
+
+    Parameters
+    ----------
+    dataX : `numpy.array` of `float`
+        Data in the abscissa axis.
+
+    dataY : `numpy.array` of `float`
+        Data in the ordinate axis.
+
+    degree : `int`
+        Degree of the polynomial to fit.
+
+    weightsY : `numpy.array` of `float`, optional
+        Weights of the data in the ordinate axis.
+
+    Return
+    ------
+    pFit : `numpy.array` of `float`
+        Array with fitted parameters.
+
+    pErr : `numpy.array` of `float`
+        Array with errors for fitted parameters.
+
+    reducedChiSq : `float`
+        Reduced chi squared, unweighted if weightsY is not provided.
+    """
+    if weightsY is None:
+        weightsY = np.ones(len(dataX))
+
+    design = np.polynomial.polynomial.polyvander(dataX, degree)
+    weightedDesign = weightsY[:, np.newaxis]*design
+    pFit, _, rank, _ = np.linalg.lstsq(weightedDesign, dataY*weightsY, rcond=None)
+
+    nPars = degree + 1
+    if len(dataY) > nPars and rank == nPars:
+        reducedChiSq = calculateWeightedReducedChi2(dataY, funcPolynomial(pFit, dataX), weightsY,
+                                                    len(dataY), nPars)
+        # Same convention as fitLeastSq: scale the fractional covariance
+        # by the reduced chi2 before taking the diagonal.
+        pCov = np.linalg.inv(weightedDesign.T @ weightedDesign)*reducedChiSq
+        pErr = np.sqrt(np.fabs(np.diag(pCov)))
+    else:
+        pErr = np.full(nPars, np.nan)
+        reducedChiSq = np.nan
+
+    return pFit, pErr, reducedChiSq
+
+
 def fitBootstrap(initialParams, dataX, dataY, function, weightsY=None, confidenceSigma=1.):
     """Do a fit using least squares and bootstrap to estimate parameter errors.
 
@@ -459,14 +529,20 @@ def fitBootstrap(initialParams, dataX, dataY, function, weightsY=None, confidenc
     # Get the stdev of the residuals
     residuals = errFunc(pFit, dataX, dataY, weightsY)
     # 100 random data sets are generated and fitted
-    pars = []
-    for i in range(100):
-        randomDelta = np.random.normal(0., np.fabs(residuals), len(dataY))
-        randomDataY = dataY + randomDelta
-        randomFit, _ = leastsq(errFunc, initialParams,
-                               args=(dataX, randomDataY, weightsY), full_output=0)
-        pars.append(randomFit)
-    pars = np.array(pars)
+    nResamples = 100
+    rng = np.random.default_rng()
+    # Draw all the perturbations up front rather than one set per resample.
+    randomDataY = dataY + rng.normal(0., np.fabs(residuals), size=(nResamples, len(dataY)))
+    if function is funcPolynomial:
+        # The polynomial model is linear in its parameters, so the
+        # resampled weighted fits reduce to a single pseudo-inverse
+        # applied to the whole batch of perturbed ordinates.
+        design = np.polynomial.polynomial.polyvander(dataX, len(initialParams) - 1)
+        pinv = np.linalg.pinv(weightsY[:, np.newaxis]*design)
+        pars = (weightsY*randomDataY) @ pinv.T
+    else:
+        pars = np.array([leastsq(errFunc, initialParams, args=(dataX, thisDataY, weightsY),
+                                 full_output=0)[0] for thisDataY in randomDataY])
     meanPfit = np.mean(pars, 0)
 
     # confidence interval for parameter estimates
@@ -515,6 +591,31 @@ def funcAstier(pars, x):
     return 0.5/(a00*gain*gain)*(np.exp(2*a00*x*gain)-1) + noise/(gain*gain)  # C_00
 
 
+def _jacFuncPolynomial(pars, x):
+    """Jacobian of `funcPolynomial` with respect to its parameters.
+
+    The polynomial is linear in its coefficients, so the Jacobian is just
+    the Vandermonde matrix of `x`.
+    """
+    return poly.polyvander(np.asarray(x), len(pars) - 1)
+
+
+def _jacFuncAstier(pars, x):
+    """Jacobian of `funcAstier` with respect to its parameters.
+
+    Returns an (len(x), 3) array with the derivatives of Eq. 16 of
+    Astier+19 with respect to a00, gain, and noise.
+    """
+    a00, gain, noise = pars
+    x = np.asarray(x)
+    expm1U = np.expm1(2*a00*gain*x)
+    expU = expm1U + 1
+    dA00 = x*expU/(a00*gain) - 0.5*expm1U/(a00*a00*gain*gain)
+    dGain = x*expU/(gain*gain) - expm1U/(a00*gain**3) - 2*noise/gain**3
+    dNoise = np.full_like(x, 1/(gain*gain), dtype=np.float64)
+    return np.stack([dA00, dGain, dNoise], axis=-1)
+
+
 def arrangeFlatsByExpTime(exposureList):
     """Arrange exposures by exposure time.
 
@@ -532,10 +633,8 @@ def arrangeFlatsByExpTime(exposureList):
     """
     flatsAtExpTime = {}
     for exp in exposureList:
-        tempFlat = exp
-        expTime = tempFlat.getInfo().getVisitInfo().getExposureTime()
-        listAtExpTime = flatsAtExpTime.setdefault(expTime, [])
-        listAtExpTime.append(tempFlat)
+        expTime = exp.getInfo().getVisitInfo().getExposureTime()
+        flatsAtExpTime.setdefault(expTime, []).append(exp)
 
     return flatsAtExpTime
 
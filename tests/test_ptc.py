@@ -35,6 +35,7 @@ import lsst.utils.tests
 import lsst.cp.pipe as cpPipe
 import lsst.ip.isr.isrMock as isrMock
 from lsst.ip.isr import PhotonTransferCurveDataset
+from lsst.cp.pipe.ptc.astierCovPtcUtils import (CovFft, computeCovDirect, covDirectValue)
 from lsst.cp.pipe.utils import (funcPolynomial, makeMockFlats)
 
 
@@ -152,6 +153,58 @@ class MeasurePhotonTransferCurveTaskTestCase(lsst.utils.tests.TestCase):
             for v1, v2 in zip(varStandard[amp], resultsSolve.outputPtcDataset.finalVars[amp]):
                 self.assertAlmostEqual(v1/v2, 1.0, places=1)
 
+    def test_computeCovDirectWithMask(self):
+        """Test the masked branch of computeCovDirect against the single-lag reference.
+
+        With any bad pixel present the covariances come from FFT
+        cross-correlations; covDirectValue computes one lag at a time and
+        serves as the independent check, including the averaging of the
+        (dx, dy) and (dx, -dy) lags.
+        """
+        maxRange = 4
+        rng = np.random.RandomState(42)
+        diffIm = rng.normal(0., 5., (60, 63))
+        w = np.ones_like(diffIm)
+        w[10:14, 20:30] = 0
+        w[rng.randint(0, 60, 50), rng.randint(0, 63, 50)] = 0
+
+        covResults = computeCovDirect(diffIm, w, maxRange)
+
+        self.assertEqual(len(covResults), (maxRange + 1)**2)
+        for (dx, dy, var, cov, nPix) in covResults:
+            if dx > 0 and dy > 0:
+                cov1, nPix1 = covDirectValue(diffIm, w, dx, dy)
+                cov2, nPix2 = covDirectValue(diffIm, w, dx, -dy)
+                expectedCov, expectedNPix = 0.5*(cov1 + cov2), nPix1 + nPix2
+            else:
+                expectedCov, expectedNPix = covDirectValue(diffIm, w, dx, dy)
+            self.assertAlmostEqual(cov, expectedCov)
+            self.assertEqual(nPix, expectedNPix)
+            # The variance entry of every record is the (0, 0) covariance.
+            self.assertAlmostEqual(var, covResults['cov'][0])
+
+    def test_covFftFromStack(self):
+        """Test that the batched FFTs of CovFft.fromStack match per-image CovFft objects."""
+        maxRange = 4
+        rng = np.random.RandomState(1234)
+        diffs, ws = [], []
+        for _ in range(3):
+            diffs.append(rng.normal(0., 5., (50, 51)))
+            w = np.ones((50, 51))
+            w[rng.randint(0, 50, 40), rng.randint(0, 51, 40)] = 0
+            ws.append(w)
+        fftShape = (64, 64)
+
+        covFfts = CovFft.fromStack(diffs, ws, fftShape, maxRange)
+
+        self.assertEqual(len(covFfts), len(diffs))
+        for diff, w, batched in zip(diffs, ws, covFfts):
+            single = CovFft(diff, w, fftShape, maxRange)
+            for rowBatched, rowSingle in zip(batched.reportCovFft(maxRange),
+                                             single.reportCovFft(maxRange)):
+                for a, b in zip(rowBatched, rowSingle):
+                    self.assertAlmostEqual(a, b)
+
     def ptcFitAndCheckPtc(self, order=None, fitType=None, doTableArray=False, doFitBootstrap=False):
         localDataset = copy.copy(self.dataset)
         localDataset.ptcFitType = fitType
@@ -275,6 +328,48 @@ class MeasurePhotonTransferCurveTaskTestCase(lsst.utils.tests.TestCase):
             for (fitType, order) in [('POLYNOMIAL', 2), ('POLYNOMIAL', 3), ('EXPAPPROXIMATION', None)]:
                 self.ptcFitAndCheckPtc(fitType=fitType, order=order, doTableArray=createArray)
 
+    def test_ptcFitWithNans(self):
+        """Test that points from failed exposure pairs (NaN mean and variance) are masked out."""
+        localDataset = copy.copy(self.dataset)
+        localDataset.ptcFitType = 'EXPAPPROXIMATION'
+        g = self.gain
+        for ampName in self.ampNames:
+            mu = np.array(localDataset.rawMeans[ampName], dtype=float)
+            var = 0.5/(self.a00*g**2)*(np.exp(2*self.a00*mu*g)-1) + self.noiseSq/(g*g)
+            # A pair whose measurement failed is stored as NaN.
+            mu[5] = np.nan
+            var[5] = np.nan
+            localDataset.rawMeans[ampName] = mu
+            localDataset.rawVars[ampName] = var
+
+        solveTask = cpPipe.ptc.PhotonTransferCurveSolveTask(config=copy.copy(self.defaultConfigSolve))
+        localDataset = solveTask.fitPtc(localDataset)
+
+        for ampName in self.ampNames:
+            self.assertFalse(localDataset.expIdMask[ampName][5])
+            self.assertAlmostEqual(self.gain, localDataset.gain[ampName])
+
+    def test_ptcFitRobustLoss(self):
+        """Test the soft_l1 outlier-rejection loss with an outlier in the series."""
+        localDataset = copy.copy(self.dataset)
+        localDataset.ptcFitType = 'EXPAPPROXIMATION'
+        g = self.gain
+        for ampName in self.ampNames:
+            mu = np.array(localDataset.rawMeans[ampName], dtype=float)
+            var = 0.5/(self.a00*g**2)*(np.exp(2*self.a00*mu*g)-1) + self.noiseSq/(g*g)
+            var[50] *= 1.3
+            localDataset.rawMeans[ampName] = mu
+            localDataset.rawVars[ampName] = var
+
+        configSolve = copy.copy(self.defaultConfigSolve)
+        configSolve.ptcOutlierFitLoss = 'soft_l1'
+        solveTask = cpPipe.ptc.PhotonTransferCurveSolveTask(config=configSolve)
+        localDataset = solveTask.fitPtc(localDataset)
+
+        for ampName in self.ampNames:
+            self.assertFalse(localDataset.expIdMask[ampName][50])
+            self.assertAlmostEqual(self.gain, localDataset.gain[ampName])
+
     def test_meanVarMeasurement(self):
         task = self.defaultTaskExtract
         mu, varDiff, _ = task.measureMeanVarCov(self.flatExp1, self.flatExp2)
@@ -282,6 +377,23 @@ class MeasurePhotonTransferCurveTaskTestCase(lsst.utils.tests.TestCase):
         self.assertLess(self.flatWidth - np.sqrt(varDiff), 1)
         self.assertLess(self.flatMean - mu, 1)
 
+    def test_meanVarMeasurementFftSinglePrecision(self):
+        """Test that single-precision covariance FFTs track the double-precision results."""
+        config = copy.copy(self.defaultConfigExtract)
+        config.doFftSinglePrecision = True
+        task = cpPipe.ptc.PhotonTransferCurveExtractTask(config=config)
+
+        mu, varDiff, covs = task.measureMeanVarCov(self.flatExp1, self.flatExp2)
+        muRef, varRef, covsRef = self.defaultTaskExtract.measureMeanVarCov(self.flatExp1, self.flatExp2)
+
+        # The clipped statistics do not go through the FFTs.
+        self.assertAlmostEqual(mu, muRef)
+        self.assertAlmostEqual(varDiff, varRef)
+        # The covariances only carry single precision; compare them at a
+        # tolerance scaled to the variance.
+        for a, b in zip(covs['cov'], covsRef['cov']):
+            self.assertAlmostEqual(a, b, delta=1e-4*covsRef['cov'][0])
+
     def test_meanVarMeasurementWithNans(self):
         task = self.defaultTaskExtract
         self.flatExp1.image.array[20:30, :] = np.nan